@@ -3,55 +3,78 @@ Controladores para la API de Telecomunicaciones.
 Implementa el patrón MVC separando la lógica de negocio de los endpoints.
 """
 
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Iterator, List, Optional
+from pydantic import TypeAdapter
 from datetime import date, timedelta
+from decimal import Decimal
 
 from . import models, schemas, crud
 from .deps import get_password_hash
 
+logger = logging.getLogger(__name__)
+
+# Pool dedicado al hashing de contraseñas (CPU), para no bloquear el event loop
+hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Serializador de un lote de facturas a JSON, para respuestas en streaming
+facturas_adapter = TypeAdapter(List[schemas.Factura])
+
 class AuthController:
     """Controlador para autenticación y autorización."""
     
     @staticmethod
-    def register_user(user_data: schemas.UsuarioCreate, db: Session) -> models.Usuario:
+    async def register_user(user_data: schemas.UsuarioCreate, db: Session) -> models.Usuario:
         """
         Registra un nuevo usuario en el sistema.
         Valida que el username no exista y cifra la contraseña.
         """
         # Verificar si el usuario ya existe
-        existing_user = crud.get_user(db, user_data.username)
-        if existing_user:
+        if crud.user_exists(db, user_data.username):
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="El username ya existe"
             )
         
-        # Crear el usuario
-        return crud.create_user(db, user_data)
+        # Crear el usuario (el hash se calcula en el pool de hashing)
+        loop = asyncio.get_running_loop()
+        password_hash = await loop.run_in_executor(hash_pool, crud.hash_pw, user_data.password)
+        return crud.create_user_with_hash(db, user_data, password_hash)
     
     @staticmethod
-    def authenticate_user(username: str, password: str, db: Session) -> Optional[models.Usuario]:
+    async def authenticate_user(username: str, password: str, db: Session) -> Optional[models.Usuario]:
         """
         Autentica un usuario con username y password.
         Retorna el usuario si las credenciales son válidas.
         """
-        print(f"Authenticating user: {username}")  # Debug
+        logger.debug("Authenticating user: %s", username)
         user = crud.get_user(db, username)
         if not user:
-            print(f"User not found: {username}")  # Debug
+            logger.debug("User not found: %s", username)
             return None
         
-        print(f"User found: {user.username}, checking password...")  # Debug
-        password_valid = crud.verify_pw(password, user.password_hash)
-        print(f"Password verification result: {password_valid}")  # Debug
+        logger.debug("User found: %s, checking password...", user.username)
+        loop = asyncio.get_running_loop()
+        password_valid, new_hash = await loop.run_in_executor(
+            hash_pool, crud.verify_and_update_pw, password, user.password_hash
+        )
+        logger.debug("Password verification result: %s", password_valid)
         
         if not password_valid:
-            print(f"Password verification failed for user: {username}")  # Debug
+            logger.debug("Password verification failed for user: %s", username)
             return None
         
-        print(f"Authentication successful for user: {username}")  # Debug
+        # Migrar hashes bcrypt (o parámetros antiguos) al esquema actual
+        if new_hash:
+            user.password_hash = new_hash
+            db.commit()
+        
+        logger.debug("Authentication successful for user: %s", username)
         return user
 
 class FacturaController:
@@ -73,12 +96,43 @@ class FacturaController:
         
         return crud.list_facturas(db, user_id)
     
+    @staticmethod
+    def stream_user_facturas(user_id: int, db: Session) -> Iterator[bytes]:
+        """
+        Genera el JSON de la lista de facturas del usuario por partes.
+        Cada parte es un lote de filas: la memoria usada no crece con el total de facturas.
+        """
+        yield b"["
+        separador = b""
+        for lote in crud.iter_facturas(db, user_id).partitions():
+            # Una validación y un dump por lote; se quitan los corchetes del array del lote
+            lote_json = facturas_adapter.dump_json(facturas_adapter.validate_python(lote, from_attributes=True))
+            yield separador + lote_json[1:-1]
+            separador = b","
+        yield b"]"
+    
+    @staticmethod
+    def get_user_with_facturas(user_id: int, db: Session) -> models.Usuario:
+        """
+        Obtiene un usuario junto con todas sus facturas.
+        Las facturas se cargan explícitamente en una consulta adicional (selectinload).
+        """
+        user = crud.get_user_with_facturas(db, user_id)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Usuario no encontrado"
+            )
+        
+        return user
+    
     @staticmethod
     def get_factura_by_id(factura_id: int, user_id: int, db: Session) -> models.Factura:
         """
         Obtiene una factura específica verificando que pertenezca al usuario.
+        Las facturas de otros usuarios responden 404 para no revelar su existencia.
         """
-        factura = crud.get_factura_by_id(db, factura_id)
+        factura = crud.get_factura_by_id(db, factura_id, user_id)
         
         if not factura:
             raise HTTPException(
@@ -86,12 +140,6 @@ class FacturaController:
                 detail="Factura no encontrada"
             )
         
-        if factura.usuario_id != user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tienes permisos para acceder a esta factura"
-            )
-        
         return factura
     
     @staticmethod
@@ -104,8 +152,8 @@ class FacturaController:
         factura = FacturaController.get_factura_by_id(factura_id, user_id, db)
         
         # Validar que la factura esté pendiente
-        if factura.estado != models.EstadoFactura.PENDIENTE:
-            if factura.estado == models.EstadoFactura.PAGADO:
+        if factura.estado is not models.EstadoFactura.PENDIENTE:
+            if factura.estado is models.EstadoFactura.PAGADO:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="La factura ya está pagada"
@@ -123,7 +171,7 @@ class FacturaController:
         
         # Procesar el pago
         try:
-            factura_pagada = crud.pay_factura(db, factura_id)
+            factura_pagada = crud.pay_factura(db, factura)
             if not factura_pagada:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -140,27 +188,46 @@ class FacturaController:
     def get_user_statistics(user_id: int, db: Session) -> schemas.EstadisticasUsuario:
         """
         Calcula estadísticas de facturas para un usuario.
+        Los conteos y montos se agregan en la base de datos.
+        """
+        stats = crud.get_user_statistics(db, user_id)
+        return schemas.EstadisticasUsuario(**stats)
+
+    @staticmethod
+    def get_user_summary(user_id: int, db: Session) -> dict:
+        """
+        Obtiene las facturas del usuario separadas por estado junto con sus estadísticas.
+        Usa una sola consulta y una sola pasada: las estadísticas salen de las mismas filas.
         """
         facturas = crud.list_facturas(db, user_id)
         
-        total_facturas = len(facturas)
-        facturas_pendientes = len([f for f in facturas if f.estado == models.EstadoFactura.PENDIENTE])
-        facturas_pagadas = len([f for f in facturas if f.estado == models.EstadoFactura.PAGADO])
+        PEND = models.EstadoFactura.PENDIENTE
+        PAG = models.EstadoFactura.PAGADO
+        pendientes, pagadas = [], []
+        monto_pendiente = monto_pagado = Decimal("0.00")
+        for factura in facturas:
+            estado = factura.estado
+            if estado is PEND:
+                pendientes.append(factura)
+                monto_pendiente += factura.monto
+            elif estado is PAG:
+                pagadas.append(factura)
+                monto_pagado += factura.monto
         
-        monto_total_pendiente = sum(
-            f.monto for f in facturas if f.estado == models.EstadoFactura.PENDIENTE
-        )
-        monto_total_pagado = sum(
-            f.monto for f in facturas if f.estado == models.EstadoFactura.PAGADO
-        )
+        # Próximas a vencer primero; igual que en SQLite, sin fecha de vencimiento al inicio
+        pendientes.sort(key=lambda f: (f.fecha_vencimiento is not None, f.fecha_vencimiento))
         
-        return schemas.EstadisticasUsuario(
-            total_facturas=total_facturas,
-            facturas_pendientes=facturas_pendientes,
-            facturas_pagadas=facturas_pagadas,
-            monto_total_pendiente=monto_total_pendiente,
-            monto_total_pagado=monto_total_pagado
-        )
+        return {
+            "facturas_pendientes": pendientes,
+            "facturas_pagadas": pagadas,
+            "estadisticas": {
+                "total_facturas": len(facturas),
+                "facturas_pendientes": len(pendientes),
+                "facturas_pagadas": len(pagadas),
+                "monto_total_pendiente": monto_pendiente,
+                "monto_total_pagado": monto_pagado
+            }
+        }
 
 class ValidationController:
     """Controlador para validaciones de negocio."""
@@ -172,7 +239,7 @@ class ValidationController:
         Incluye reglas de negocio específicas.
         """
         # Debe estar en estado PENDIENTE
-        if factura.estado != models.EstadoFactura.PENDIENTE:
+        if factura.estado is not models.EstadoFactura.PENDIENTE:
             return False
         
         # El monto debe ser mayor a 0
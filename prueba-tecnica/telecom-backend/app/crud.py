@@ -1,26 +1,48 @@
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, lambda_stmt, literal, select
+from sqlalchemy.orm import Session, selectinload
 from . import models, schemas
-
-pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .security import pwd_ctx
 
 def get_user(db: Session, username: str):
     """Obtiene un usuario por username."""
-    return db.query(models.Usuario).filter(models.Usuario.username == username).first()
+    stmt = lambda_stmt(lambda: select(models.Usuario).where(models.Usuario.username == username))
+    return db.execute(stmt).scalar_one_or_none()
+
+def user_exists(db: Session, username: str) -> bool:
+    """Indica si existe un usuario con ese username, sin cargar la fila."""
+    stmt = lambda_stmt(lambda: select(literal(1))
+                       .where(models.Usuario.username == username)
+                       .limit(1))
+    return db.execute(stmt).scalar() is not None
 
 def get_user_by_id(db: Session, user_id: int):
-    """Obtiene un usuario por ID."""
-    return db.query(models.Usuario).filter(models.Usuario.id == user_id).first()
+    """Obtiene un usuario por ID (consulta por clave primaria, usa el identity map)."""
+    return db.get(models.Usuario, user_id)
+
+def get_user_with_facturas(db: Session, user_id: int):
+    """Obtiene un usuario por ID cargando explícitamente sus facturas."""
+    return db.query(models.Usuario)\
+             .options(selectinload(models.Usuario.facturas))\
+             .filter(models.Usuario.id == user_id)\
+             .first()
 
 def create_user(db: Session, u: schemas.UsuarioCreate):
     """
     Crea un nuevo usuario con contraseña cifrada.
-    La contraseña se hashea usando bcrypt antes de guardarse.
+    La contraseña se hashea usando argon2id antes de guardarse.
+    """
+    return create_user_with_hash(db, u, hash_pw(u.password))
+
+def create_user_with_hash(db: Session, u: schemas.UsuarioCreate, password_hash: str):
+    """
+    Crea un nuevo usuario a partir de un hash de contraseña ya calculado.
+    Permite calcular el hash fuera de la sesión (p. ej. en un pool de hilos).
     """
-    hashed = pwd_ctx.hash(u.password)
     db_user = models.Usuario(
         username=u.username, 
-        password_hash=hashed,
+        password_hash=password_hash,
         email=u.email,
         nombre_completo=u.nombre_completo
     )
@@ -29,31 +51,77 @@ def create_user(db: Session, u: schemas.UsuarioCreate):
     db.refresh(db_user)
     return db_user
 
+def hash_pw(plain: str):
+    """Genera el hash de una contraseña en texto plano."""
+    return pwd_ctx.hash(plain)
+
 def verify_pw(plain: str, hashed: str):
     """Verifica si una contraseña en texto plano coincide con el hash."""
     return pwd_ctx.verify(plain, hashed)
 
+def verify_and_update_pw(plain: str, hashed: str):
+    """
+    Verifica la contraseña y, si el hash usa un esquema o parámetros obsoletos,
+    retorna también el nuevo hash a guardar (o None si no hace falta).
+    """
+    return pwd_ctx.verify_and_update(plain, hashed)
+
 def list_facturas(db: Session, user_id: int):
     """
     Lista todas las facturas de un usuario específico.
     Ordenadas por fecha de emisión descendente.
     """
-    return db.query(models.Factura)\
-             .filter(models.Factura.usuario_id == user_id)\
-             .order_by(models.Factura.fecha_emision.desc())\
-             .all()
+    stmt = lambda_stmt(lambda: select(models.Factura)
+                       .where(models.Factura.usuario_id == user_id)
+                       .order_by(models.Factura.fecha_emision.desc()))
+    return db.execute(stmt).scalars().all()
 
-def get_factura_by_id(db: Session, factura_id: int):
-    """Obtiene una factura específica por ID."""
-    return db.query(models.Factura).filter(models.Factura.id == factura_id).first()
+def iter_facturas(db: Session, user_id: int, batch_size: int = 500):
+    """
+    Itera las facturas de un usuario en el mismo orden que list_facturas,
+    trayéndolas por lotes de `batch_size` en lugar de cargarlas todas en memoria.
+    Usar .partitions() sobre el resultado para recorrerlas lote a lote.
+    """
+    stmt = lambda_stmt(lambda: select(models.Factura)
+                       .where(models.Factura.usuario_id == user_id)
+                       .order_by(models.Factura.fecha_emision.desc()))
+    return db.execute(stmt, execution_options={"yield_per": batch_size}).scalars()
 
-def pay_factura(db: Session, factura_id: int):
+def get_factura_by_id(db: Session, factura_id: int, user_id: int):
+    """
+    Obtiene una factura específica por ID, solo si pertenece al usuario.
+    La propiedad se filtra en la consulta, no en Python.
     """
-    Marca una factura como pagada.
+    stmt = lambda_stmt(lambda: select(models.Factura)
+                       .where(models.Factura.id == factura_id, models.Factura.usuario_id == user_id))
+    return db.execute(stmt).scalar_one_or_none()
+
+def create_factura(db: Session, user_id: int, data: schemas.FacturaCreateSimple):
+    """
+    Crea una factura pendiente para un usuario.
+    El número de factura se deriva de un UUID para evitar colisiones.
+    """
+    ahora = datetime.utcnow()
+    factura = models.Factura(
+        numero_factura=f"FAC-{uuid.uuid4().hex[:10].upper()}",
+        usuario_id=user_id,
+        monto=data.monto,
+        fecha_emision=ahora,
+        fecha_vencimiento=ahora + timedelta(days=data.dias_vencimiento or 30),
+        estado=models.EstadoFactura.PENDIENTE,
+        descripcion=data.descripcion
+    )
+    db.add(factura)
+    db.commit()
+    db.refresh(factura)
+    return factura
+
+def pay_factura(db: Session, factura: models.Factura):
+    """
+    Marca una factura ya cargada como pagada.
     Cambia el estado de PENDIENTE a PAGADO.
     """
-    factura = db.query(models.Factura).filter(models.Factura.id == factura_id).first()
-    if factura and factura.estado == models.EstadoFactura.PENDIENTE:
+    if factura.estado is models.EstadoFactura.PENDIENTE:
         factura.estado = models.EstadoFactura.PAGADO
         db.commit()
         db.refresh(factura)
@@ -61,57 +129,46 @@ def pay_factura(db: Session, factura_id: int):
 
 def get_facturas_pendientes(db: Session, user_id: int):
     """Obtiene solo las facturas pendientes de un usuario."""
-    return db.query(models.Factura)\
-             .filter(models.Factura.usuario_id == user_id)\
-             .filter(models.Factura.estado == models.EstadoFactura.PENDIENTE)\
-             .order_by(models.Factura.fecha_vencimiento.asc())\
-             .all()
+    stmt = lambda_stmt(lambda: select(models.Factura)
+                       .where(models.Factura.usuario_id == user_id)
+                       .where(models.Factura.estado == models.EstadoFactura.PENDIENTE)
+                       .order_by(models.Factura.fecha_vencimiento.asc()))
+    return db.execute(stmt).scalars().all()
 
 def get_facturas_pagadas(db: Session, user_id: int):
     """Obtiene solo las facturas pagadas de un usuario."""
-    return db.query(models.Factura)\
-             .filter(models.Factura.usuario_id == user_id)\
-             .filter(models.Factura.estado == models.EstadoFactura.PAGADO)\
-             .order_by(models.Factura.fecha_emision.desc())\
-             .all()
+    stmt = lambda_stmt(lambda: select(models.Factura)
+                       .where(models.Factura.usuario_id == user_id)
+                       .where(models.Factura.estado == models.EstadoFactura.PAGADO)
+                       .order_by(models.Factura.fecha_emision.desc()))
+    return db.execute(stmt).scalars().all()
 
 def get_user_statistics(db: Session, user_id: int):
     """
     Obtiene estadísticas completas del usuario.
-    Incluye conteos y montos totales por estado.
+    Incluye conteos y montos totales por estado, calculados en una sola consulta.
     """
-    from sqlalchemy import func
-    
-    # Estadísticas generales
-    total_facturas = db.query(models.Factura)\
-                      .filter(models.Factura.usuario_id == user_id)\
-                      .count()
-    
-    facturas_pendientes = db.query(models.Factura)\
-                           .filter(models.Factura.usuario_id == user_id)\
-                           .filter(models.Factura.estado == models.EstadoFactura.PENDIENTE)\
-                           .count()
-    
-    facturas_pagadas = db.query(models.Factura)\
-                        .filter(models.Factura.usuario_id == user_id)\
-                        .filter(models.Factura.estado == models.EstadoFactura.PAGADO)\
-                        .count()
-    
-    # Montos totales
-    monto_pendiente = db.query(func.sum(models.Factura.monto))\
-                       .filter(models.Factura.usuario_id == user_id)\
-                       .filter(models.Factura.estado == models.EstadoFactura.PENDIENTE)\
-                       .scalar() or 0
+    pendiente = models.Factura.estado == models.EstadoFactura.PENDIENTE
+    pagado = models.Factura.estado == models.EstadoFactura.PAGADO
     
-    monto_pagado = db.query(func.sum(models.Factura.monto))\
-                    .filter(models.Factura.usuario_id == user_id)\
-                    .filter(models.Factura.estado == models.EstadoFactura.PAGADO)\
-                    .scalar() or 0
+    (
+        total_facturas,
+        facturas_pendientes,
+        facturas_pagadas,
+        monto_pendiente,
+        monto_pagado,
+    ) = db.query(
+        func.count(models.Factura.id),
+        func.count(case((pendiente, 1))),
+        func.count(case((pagado, 1))),
+        func.coalesce(func.sum(case((pendiente, models.Factura.monto), else_=0)), 0),
+        func.coalesce(func.sum(case((pagado, models.Factura.monto), else_=0)), 0),
+    ).filter(models.Factura.usuario_id == user_id).one()
     
     return {
         "total_facturas": total_facturas,
         "facturas_pendientes": facturas_pendientes,
         "facturas_pagadas": facturas_pagadas,
-        "monto_total_pendiente": str(monto_pendiente),
-        "monto_total_pagado": str(monto_pagado)
+        "monto_total_pendiente": monto_pendiente,
+        "monto_total_pagado": monto_pagado
     }
@@ -1,10 +1,15 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from functools import lru_cache
+from threading import Lock
+import time
+from typing import NamedTuple
+from cachetools import TTLCache
 from .database import SessionLocal
 from . import crud
+from .security import pwd_ctx
 
 # Configuración JWT
 SECRET_KEY = "your-secret-key-here-change-in-production"  # En producción usar una clave más segura
@@ -12,7 +17,20 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 horas
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Caché username -> id de usuarios autenticados, para no consultar la BD en cada request.
+# No se invalida: un usuario eliminado puede seguir autenticándose hasta USER_CACHE_TTL_SECONDS.
+USER_CACHE_TTL_SECONDS = 30
+_user_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL_SECONDS)
+_user_cache_lock = Lock()
+
+class CurrentUser(NamedTuple):
+    """
+    Usuario autenticado tal como lo ven los endpoints: solo id y username.
+    Quien necesite la fila completa debe cargarla con crud.get_user_by_id.
+    """
+    id: int
+    username: str
 
 def get_db():
     """
@@ -28,15 +46,15 @@ def get_db():
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verifica si una contraseña en texto plano coincide con el hash almacenado.
-    Usa bcrypt para la verificación segura.
+    Acepta tanto hashes argon2id como bcrypt heredados.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_ctx.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """
-    Genera un hash seguro de una contraseña usando bcrypt.
+    Genera un hash seguro de una contraseña usando argon2id.
     """
-    return pwd_context.hash(password)
+    return pwd_ctx.hash(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     """
@@ -53,10 +71,29 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_db)):
+@lru_cache(maxsize=4096)
+def _decode_cached(token: str) -> dict:
+    """
+    Decodifica y valida la firma de un token JWT, memorizando el resultado por token.
+    La expiración se vuelve a comprobar en cada uso (ver _decode_token).
+    Si se rota SECRET_KEY hay que llamar a _decode_cached.cache_clear().
+    """
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def _decode_token(token: str) -> dict:
+    """
+    Retorna el payload de un token válido y no expirado.
+    Lanza JWTError si el token es inválido o ya expiró.
+    """
+    payload = _decode_cached(token)
+    if payload.get("exp", 0) <= time.time():
+        raise JWTError("Token expirado")
+    return payload
+
+def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_db)) -> CurrentUser:
     """
     Obtiene el usuario actual basado en el token JWT.
-    Valida el token y retorna el usuario autenticado.
+    Valida el token y retorna un CurrentUser, venga de la caché o de la BD.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -65,18 +102,25 @@ def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_db)):
     )
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
+    with _user_cache_lock:
+        user_id = _user_cache.get(username)
+    if user_id is not None:
+        return CurrentUser(id=user_id, username=username)
+    
     user = crud.get_user(db, username)
     if user is None:
         raise credentials_exception
     
-    return user
+    with _user_cache_lock:
+        _user_cache[username] = user.id
+    return CurrentUser(id=user.id, username=user.username)
 
 def verify_token(token: str) -> dict:
     """
@@ -84,8 +128,7 @@ def verify_token(token: str) -> dict:
     Útil para operaciones que solo necesitan validar el token.
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        return _decode_token(token)
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
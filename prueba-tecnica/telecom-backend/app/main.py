@@ -1,14 +1,25 @@
+import logging
+import os
+import random
+from decimal import Decimal
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from . import models, schemas
+from . import crud, models, schemas
 from .database import engine
 from .deps import get_db, get_current_user, create_access_token
 from .controllers import AuthController, FacturaController, ValidationController
 
-# Crea las tablas en MySQL si no existen
-models.Base.metadata.create_all(bind=engine)
+# INFO por defecto: los mensajes de debug del login no se formatean ni se escriben
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+# Las tablas se crean con init_db.py / recreate_db.py. Solo se verifican al
+# importar la app si se pide explícitamente, para no repetirlo en cada worker.
+if os.getenv("RUN_CREATE_ALL") == "1":
+    models.Base.metadata.create_all(bind=engine)
 
 # Aquí definimos la instancia de FastAPI que Uvicorn cargará
 app = FastAPI(
@@ -29,31 +40,42 @@ app.add_middleware(
 )
 
 @app.post("/auth/login", response_model=schemas.Token, summary="Autenticación de usuario")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """
     Autentica un usuario con username y password.
     Retorna un token JWT para acceso a endpoints protegidos.
     """
-    print(f"Login attempt for username: {form_data.username}")  # Debug log
-    user = AuthController.authenticate_user(form_data.username, form_data.password, db)
+    logger.debug("Login attempt for username: %s", form_data.username)
+    user = await AuthController.authenticate_user(form_data.username, form_data.password, db)
     if not user:
-        print(f"Authentication failed for username: {form_data.username}")  # Debug log
+        logger.debug("Authentication failed for username: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales incorrectas",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    print(f"Authentication successful for username: {form_data.username}")  # Debug log
+    logger.debug("Authentication successful for username: %s", form_data.username)
     access_token = create_access_token(data={"sub": user.username})
     return schemas.Token(access_token=access_token, token_type="bearer")
 
 @app.post("/auth/register", response_model=schemas.Usuario, status_code=status.HTTP_201_CREATED, summary="Registro de usuario")
-def register(u: schemas.UsuarioCreate, db: Session = Depends(get_db)):
+async def register(u: schemas.UsuarioCreate, db: Session = Depends(get_db)):
     """
     Registra un nuevo usuario en el sistema.
-    Las contraseñas se cifran automáticamente con bcrypt.
+    Las contraseñas se cifran automáticamente con argon2id.
+    """
+    return await AuthController.register_user(u, db)
+
+@app.get("/usuarios/me", response_model=schemas.UsuarioConFacturas, summary="Consultar usuario con sus facturas")
+def consultar_usuario_actual(
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
-    return AuthController.register_user(u, db)
+    Obtiene los datos del usuario autenticado junto con todas sus facturas.
+    Es el único endpoint que serializa las facturas dentro del usuario.
+    """
+    return FacturaController.get_user_with_facturas(current_user.id, db)
 
 @app.get("/facturas/", response_model=list[schemas.Factura], summary="Consultar estado de cuenta")
 def consultar_facturas(
@@ -66,6 +88,20 @@ def consultar_facturas(
     """
     return FacturaController.get_user_facturas(current_user.id, db)
 
+@app.get("/facturas/stream", response_class=StreamingResponse, summary="Consultar estado de cuenta (streaming)")
+def consultar_facturas_stream(
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Igual que /facturas/, pero la lista JSON se envía por partes a medida que se lee.
+    Pensado para usuarios con muchas facturas: el cliente puede empezar a procesar antes.
+    """
+    return StreamingResponse(
+        FacturaController.stream_user_facturas(current_user.id, db),
+        media_type="application/json"
+    )
+
 @app.get("/facturas/pendientes", response_model=list[schemas.Factura], summary="Consultar facturas pendientes")
 def consultar_facturas_pendientes(
     current_user = Depends(get_current_user),
@@ -75,7 +111,6 @@ def consultar_facturas_pendientes(
     Consulta solo las facturas pendientes del usuario autenticado.
     Ordenadas por fecha de vencimiento (próximas a vencer primero).
     """
-    from . import crud
     return crud.get_facturas_pendientes(db, current_user.id)
 
 @app.get("/facturas/pagadas", response_model=list[schemas.Factura], summary="Consultar facturas pagadas")
@@ -87,7 +122,6 @@ def consultar_facturas_pagadas(
     Consulta solo las facturas pagadas del usuario autenticado.
     Ordenadas por fecha de emisión (más recientes primero).
     """
-    from . import crud
     return crud.get_facturas_pagadas(db, current_user.id)
 
 @app.get("/facturas/estadisticas", response_model=schemas.EstadisticasUsuario, summary="Estadísticas de facturas")
@@ -110,17 +144,7 @@ def obtener_resumen_facturas(
     Obtiene un resumen completo con facturas separadas por estado.
     Útil para mostrar en pestañas separadas en la aplicación móvil.
     """
-    from . import crud
-    
-    facturas_pendientes = crud.get_facturas_pendientes(db, current_user.id)
-    facturas_pagadas = crud.get_facturas_pagadas(db, current_user.id)
-    estadisticas = crud.get_user_statistics(db, current_user.id)
-    
-    return {
-        "facturas_pendientes": facturas_pendientes,
-        "facturas_pagadas": facturas_pagadas,
-        "estadisticas": estadisticas
-    }
+    return FacturaController.get_user_summary(current_user.id, db)
 
 @app.get("/facturas/{factura_id}", response_model=schemas.FacturaDetallada, summary="Consultar factura específica")
 def obtener_factura(
@@ -133,22 +157,7 @@ def obtener_factura(
     Solo el propietario puede acceder a sus facturas.
     Incluye información adicional como días para vencimiento.
     """
-    from datetime import datetime
-    
-    factura = FacturaController.get_factura_by_id(factura_id, current_user.id, db)
-    
-    # Calcular días para vencimiento si está pendiente
-    dias_vencimiento = None
-    if factura.estado == "PENDIENTE" and factura.fecha_vencimiento:
-        dias_vencimiento = (factura.fecha_vencimiento - datetime.now().date()).days
-    
-    # Crear respuesta detallada
-    return {
-        **factura.__dict__,
-        "dias_para_vencimiento": dias_vencimiento,
-        "puede_pagar": factura.estado == "PENDIENTE",
-        "monto_formateado": f"${factura.monto:.2f}"
-    }
+    return FacturaController.get_factura_by_id(factura_id, current_user.id, db)
 
 @app.post("/facturas/{factura_id}/pagar", response_model=schemas.PagoResponse, summary="Registrar pago")
 def registrar_pago(
@@ -176,44 +185,34 @@ def health_check():
     """Endpoint de verificación de estado del servicio."""
     return schemas.Message(message="Servicio funcionando correctamente", success=True)
 
-@app.get("/debug/users", summary="Listar todos los usuarios (solo para debug)")
+@app.get("/debug/users", response_model=list[schemas.UsuarioDebug], summary="Listar todos los usuarios (solo para debug)")
 def list_all_users(db: Session = Depends(get_db)):
     """
     Lista todos los usuarios en la base de datos.
-    Solo para propósitos de debugging.
+    Solo para propósitos de debugging. Consulta solo las columnas que se exponen.
     """
-    users = db.query(models.Usuario).all()
-    return [{"id": u.id, "username": u.username, "nombre_completo": u.nombre_completo, "created_at": u.created_at} for u in users]
+    return db.query(
+        models.Usuario.id,
+        models.Usuario.username,
+        models.Usuario.nombre_completo,
+        models.Usuario.created_at
+    ).all()
 
-@app.post("/facturas/test", response_model=schemas.Factura, summary="Crear factura de prueba (solo para testing)")
+@app.post("/facturas/test", response_model=schemas.Factura, deprecated=True, summary="Crear factura de prueba (solo para testing)")
 def crear_factura_prueba(
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Crea una factura de prueba para el usuario autenticado.
-    Solo para fines de testing.
+    Crea una factura de prueba con datos aleatorios para el usuario autenticado.
+    Obsoleto: usar /facturas/create, que comparte el mismo camino de creación.
     """
-    import random
-    from datetime import datetime, timedelta
-    from .models import Factura, EstadoFactura
-    
-    # Crear factura de prueba con datos aleatorios
-    factura = Factura(
-        numero_factura=f"FAC-{random.randint(1000, 9999)}",
-        usuario_id=current_user.id,
-        monto=random.uniform(50.0, 500.0),
-        fecha_emision=datetime.utcnow(),
-        fecha_vencimiento=datetime.utcnow() + timedelta(days=random.randint(1, 30)),
-        estado=EstadoFactura.PENDIENTE,
-        descripcion=f"Factura de servicios de telecomunicaciones"
+    factura_data = schemas.FacturaCreateSimple(
+        monto=Decimal(random.randint(5000, 50000)) / 100,
+        descripcion="Factura de servicios de telecomunicaciones",
+        dias_vencimiento=random.randint(1, 30)
     )
-    
-    db.add(factura)
-    db.commit()
-    db.refresh(factura)
-    
-    return factura
+    return crud.create_factura(db, current_user.id, factura_data)
 
 @app.post("/facturas/create", response_model=schemas.Factura, summary="Crear factura personalizada")
 def crear_factura_personalizada(
@@ -225,23 +224,4 @@ def crear_factura_personalizada(
     Crea una factura personalizada para el usuario autenticado.
     Permite especificar monto, descripción y días hasta vencimiento.
     """
-    import random
-    from datetime import datetime, timedelta
-    from .models import Factura, EstadoFactura
-    
-    # Crear factura personalizada
-    factura = Factura(
-        numero_factura=f"FAC-{random.randint(1000, 9999)}",
-        usuario_id=current_user.id,
-        monto=factura_data.monto,
-        fecha_emision=datetime.utcnow(),
-        fecha_vencimiento=datetime.utcnow() + timedelta(days=factura_data.dias_vencimiento or 30),
-        estado=EstadoFactura.PENDIENTE,
-        descripcion=factura_data.descripcion
-    )
-    
-    db.add(factura)
-    db.commit()
-    db.refresh(factura)
-    
-    return factura
+    return crud.create_factura(db, current_user.id, factura_data)
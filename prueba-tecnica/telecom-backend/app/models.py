@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, Integer, String, DECIMAL, Date, Enum, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, DECIMAL, Date, Enum, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -24,10 +24,11 @@ class Usuario(Base):
     email = Column(String(100), nullable=True)
     nombre_completo = Column(String(200), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
-    # Relación con facturas
-    facturas = relationship("Factura", back_populates="usuario", cascade="all, delete-orphan")
+    # Relación con facturas; sin carga implícita para evitar consultas N+1.
+    # Quien necesite las facturas debe cargarlas explícitamente (selectinload).
+    facturas = relationship("Factura", back_populates="usuario", cascade="all, delete-orphan", lazy="raise")
 
     def __repr__(self):
         return f"<Usuario(id={self.id}, username='{self.username}')>"
@@ -38,20 +39,25 @@ class Factura(Base):
     Representa una factura de servicios de telecomunicaciones.
     """
     __tablename__ = "facturas"
+    __table_args__ = (
+        # Cubren el filtro por usuario y estado junto con el orden de los listados
+        Index("ix_factura_user_estado_venc", "usuario_id", "estado", "fecha_vencimiento"),
+        Index("ix_factura_user_estado_emis", "usuario_id", "estado", "fecha_emision"),
+    )
     
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False, index=True)
     monto = Column(DECIMAL(10, 2), nullable=False)
     fecha_emision = Column(Date, nullable=False)
     fecha_vencimiento = Column(Date, nullable=True)
-    estado = Column(Enum(EstadoFactura), nullable=False, default=EstadoFactura.PENDIENTE, index=True)
+    estado = Column(Enum(EstadoFactura), nullable=False, default=EstadoFactura.PENDIENTE)
     descripcion = Column(String(500), nullable=True)
     numero_factura = Column(String(50), unique=True, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
-    # Relación con usuario
-    usuario = relationship("Usuario", back_populates="facturas")
+    # Relación con usuario; sin carga implícita (ningún serializer la usa)
+    usuario = relationship("Usuario", back_populates="facturas", lazy="raise")
 
     def __repr__(self):
         return f"<Factura(id={self.id}, numero='{self.numero_factura}', monto={self.monto}, estado='{self.estado}')>"
@@ -1,53 +1,74 @@
-from pydantic import BaseModel, Field, validator
+import re
+from pydantic import BaseModel, ConfigDict, Field, ValidationInfo, computed_field, field_validator
 from datetime import date, datetime
 from typing import List, Optional
 from decimal import Decimal
 from .models import EstadoFactura
 
+# Solo letras y números ASCII; str.isalnum() también acepta letras Unicode
+_USERNAME_RE = re.compile(r'\A[A-Za-z0-9]+\Z')
+
 # Schemas para Factura
-class FacturaBase(BaseModel):
-    """Schema base para Factura."""
+class FacturaCreate(BaseModel):
+    """Schema para crear una nueva factura."""
     monto: Decimal = Field(..., gt=0, description="Monto debe ser mayor a 0")
     fecha_emision: date = Field(..., description="Fecha de emisión de la factura")
     fecha_vencimiento: Optional[date] = Field(None, description="Fecha de vencimiento")
     descripcion: Optional[str] = Field(None, max_length=500, description="Descripción de la factura")
     numero_factura: Optional[str] = Field(None, max_length=50, description="Número de factura")
-
-class FacturaCreate(FacturaBase):
-    """Schema para crear una nueva factura."""
     usuario_id: int = Field(..., gt=0, description="ID del usuario propietario")
     
-    @validator('fecha_vencimiento')
-    def validate_fecha_vencimiento(cls, v, values):
-        if v and 'fecha_emision' in values and v < values['fecha_emision']:
+    @field_validator('fecha_vencimiento')
+    @classmethod
+    def validate_fecha_vencimiento(cls, v, info: ValidationInfo):
+        if v and 'fecha_emision' in info.data and v < info.data['fecha_emision']:
             raise ValueError('Fecha de vencimiento no puede ser anterior a fecha de emisión')
         return v
 
 class FacturaCreateSimple(BaseModel):
     """Schema simple para crear facturas de prueba."""
-    monto: float = Field(..., gt=0, description="Monto de la factura")
+    monto: Decimal = Field(..., gt=0, max_digits=10, decimal_places=2, description="Monto de la factura")
     descripcion: str = Field("Factura de servicios", description="Descripción de la factura")
     dias_vencimiento: Optional[int] = Field(30, description="Días hasta vencimiento")
 
-class Factura(FacturaBase):
+class Factura(BaseModel):
     """Schema completo de Factura para respuestas."""
+    monto: Decimal = Field(..., gt=0, description="Monto debe ser mayor a 0")
+    fecha_emision: date = Field(..., description="Fecha de emisión de la factura")
+    fecha_vencimiento: Optional[date] = Field(None, description="Fecha de vencimiento")
+    descripcion: Optional[str] = Field(None, max_length=500, description="Descripción de la factura")
+    numero_factura: Optional[str] = Field(None, max_length=50, description="Número de factura")
     id: int
     usuario_id: int
     estado: EstadoFactura
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     
-    class Config:
-        from_attributes = True
+    # Schema de solo lectura: inmutable y sin campos extra (también aplica a FacturaDetallada)
+    model_config = ConfigDict(from_attributes=True, extra='forbid', frozen=True)
 
 class FacturaDetallada(Factura):
-    """Schema extendido de Factura con información adicional para vista de detalles."""
-    dias_para_vencimiento: Optional[int] = None
-    puede_pagar: bool = False
-    monto_formateado: str = ""
+    """
+    Schema extendido de Factura con información adicional para vista de detalles.
+    Los campos adicionales se calculan al serializar a partir de la propia factura.
+    """
+    
+    @computed_field
+    @property
+    def dias_para_vencimiento(self) -> Optional[int]:
+        if self.estado is EstadoFactura.PENDIENTE and self.fecha_vencimiento:
+            return (self.fecha_vencimiento - date.today()).days
+        return None
     
-    class Config:
-        from_attributes = True
+    @computed_field
+    @property
+    def puede_pagar(self) -> bool:
+        return self.estado is EstadoFactura.PENDIENTE
+    
+    @computed_field
+    @property
+    def monto_formateado(self) -> str:
+        return f"${self.monto:.2f}"
 
 class PagoResponse(BaseModel):
     """Schema para respuesta de pago exitoso."""
@@ -62,8 +83,10 @@ class EstadisticasUsuario(BaseModel):
     total_facturas: int
     facturas_pendientes: int
     facturas_pagadas: int
-    monto_total_pendiente: str
-    monto_total_pagado: str
+    monto_total_pendiente: Decimal
+    monto_total_pagado: Decimal
+    
+    model_config = ConfigDict(extra='forbid', frozen=True)
 
 class ResumenFacturas(BaseModel):
     """Schema para resumen completo de facturas separadas por estado."""
@@ -77,31 +100,38 @@ class UsuarioBase(BaseModel):
     username: str = Field(..., min_length=3, max_length=50, description="Nombre de usuario")
     email: Optional[str] = Field(None, description="Email del usuario")
     nombre_completo: Optional[str] = Field(None, description="Nombre completo del usuario")
-    
-    @validator('username')
-    def validate_username(cls, v):
-        if not v.isalnum():
-            raise ValueError('Username debe contener solo letras y números')
-        return v.lower()
 
 class UsuarioCreate(UsuarioBase):
     """Schema para crear un nuevo usuario."""
     password: str = Field(..., min_length=6, description="Contraseña mínimo 6 caracteres")
     
-    @validator('password')
-    def validate_password(cls, v):
-        if len(v) < 6:
-            raise ValueError('Password debe tener al menos 6 caracteres')
-        return v
+    # Solo en la entrada: los schemas de respuesta no re-validan usuarios ya guardados
+    @field_validator('username')
+    @classmethod
+    def validate_username(cls, v):
+        if not _USERNAME_RE.match(v):
+            raise ValueError('Username debe contener solo letras y números')
+        return v.lower()
 
 class Usuario(UsuarioBase):
     """Schema completo de Usuario para respuestas."""
     id: int
     created_at: Optional[datetime] = None
+    
+    model_config = ConfigDict(from_attributes=True)
+
+class UsuarioConFacturas(Usuario):
+    """Schema de Usuario que incluye sus facturas (requiere cargarlas explícitamente)."""
     facturas: List[Factura] = []
+
+class UsuarioDebug(BaseModel):
+    """Schema mínimo de Usuario para el listado de debug (sin email ni validaciones)."""
+    id: int
+    username: str
+    nombre_completo: Optional[str] = None
+    created_at: Optional[datetime] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Schemas para respuestas
 class FacturasPaginadas(BaseModel):
@@ -111,20 +141,14 @@ class FacturasPaginadas(BaseModel):
     page: int = 1
     per_page: int = 10
 
-class EstadisticasUsuario(BaseModel):
-    """Schema para estadísticas del usuario."""
-    total_facturas: int
-    facturas_pendientes: int
-    facturas_pagadas: int
-    monto_total_pendiente: Decimal
-    monto_total_pagado: Decimal
-
 # Schema para autenticación
 class Token(BaseModel):
     """Schema para respuesta de token JWT."""
     access_token: str
     token_type: str = "bearer"
     expires_in: int = 86400  # 24 horas en segundos
+    
+    model_config = ConfigDict(extra='forbid', frozen=True)
 
 class TokenData(BaseModel):
     """Schema para datos del token."""
@@ -135,3 +159,5 @@ class Message(BaseModel):
     """Schema para mensajes de respuesta simples."""
     message: str
     success: bool = True
+    
+    model_config = ConfigDict(extra='forbid', frozen=True)
@@ -0,0 +1,14 @@
+from passlib.context import CryptContext
+
+# Contexto único de hashing compartido por crud y deps.
+# argon2id para hashes nuevos; los hashes bcrypt existentes siguen verificando
+# y se re-hashean en el siguiente login exitoso
+pwd_ctx = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default="argon2",
+    deprecated="auto",
+    bcrypt__rounds=10,
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+)
@@ -1,47 +1,87 @@
+"""
+Script para crear las tablas (si hace falta) y cargar los datos de prueba.
+No tiene efectos al importarse: se ejecuta con `python init_db.py`.
+"""
+import os
+from itertools import islice
+from sqlalchemy import insert, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.database import SessionLocal, engine
-from app import models, crud, schemas
+from app import models, schemas
 from datetime import date
+from decimal import Decimal
 
-# Crear las tablas
-models.Base.metadata.create_all(bind=engine)
+# Filas por INSERT: lotes de ~1000 evitan tanto fila a fila como un único lote gigante
+BATCH_SIZE = 1000
 
-db = SessionLocal()
+# Credenciales del usuario de prueba. El hash (argon2id, mismos parámetros que
+# app.security) está precalculado para no re-hashear la contraseña en cada ejecución;
+# si cambian ADMIN_PASSWORD o los parámetros de hashing hay que regenerarlo.
+ADMIN_PASSWORD = "admin123"
+FIXTURE_ADMIN_HASH = "$argon2id$v=19$m=19456,t=2,p=1$RwihlFLKmZNyLgXA+B/jnA$576BBrp37JVZ0QP5pd9OfQ+jvF9ueRqIWO8SZddd9Yk"
 
-# Crear usuario de prueba
-if not crud.get_user(db, "admin"):
-    user_data = schemas.UsuarioCreate(username="admin", password="admin123")
-    user = crud.create_user(db, user_data)
-    print(f"Usuario creado: {user.username}")
-    
-    # Crear facturas de prueba
-    facturas = [
-        models.Factura(
-            usuario_id=user.id,
-            fecha_emision=date(2024, 1, 15),
-            monto=150.50,
-            estado=models.EstadoFactura.PENDIENTE
-        ),
-        models.Factura(
-            usuario_id=user.id,
-            fecha_emision=date(2024, 2, 15),
-            monto=220.75,
-            estado=models.EstadoFactura.PAGADO
-        ),
-        models.Factura(
-            usuario_id=user.id,
-            fecha_emision=date(2024, 3, 15),
-            monto=185.00,
-            estado=models.EstadoFactura.PENDIENTE
-        )
-    ]
+def chunked(rows, size):
+    """Agrupa un iterable en listas de hasta `size` elementos."""
+    it = iter(rows)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+def main():
+    """Crea las tablas si hace falta y carga los datos de prueba."""
+    # Crear las tablas solo si se pide (RUN_CREATE_ALL=1, igual que en app.main) o si falta
+    # alguna; una sola consulta al catálogo en lugar de la revisión tabla por tabla de create_all
+    existing_tables = set(inspect(engine).get_table_names())
+    if os.getenv("RUN_CREATE_ALL") == "1" or not set(models.Base.metadata.tables) <= existing_tables:
+        models.Base.metadata.create_all(bind=engine)
     
-    for factura in facturas:
-        db.add(factura)
+    db = SessionLocal()
+    try:
+        # Crear usuario de prueba: un solo INSERT ... ON CONFLICT DO NOTHING en lugar de
+        # SELECT + INSERT, sin ventana de carrera entre ejecuciones concurrentes del seed
+        user_data = schemas.UsuarioCreate(username="admin", password=ADMIN_PASSWORD)
+        stmt = sqlite_insert(models.Usuario)\
+            .values(
+                username=user_data.username,
+                password_hash=FIXTURE_ADMIN_HASH,
+                email=user_data.email,
+                nombre_completo=user_data.nombre_completo
+            )\
+            .on_conflict_do_nothing(index_elements=["username"])\
+            .returning(models.Usuario.id)
+        user_id = db.execute(stmt).scalar_one_or_none()
+        
+        # Solo quien insertó el usuario crea sus facturas, en la misma transacción
+        if user_id is not None:
+            print(f"Usuario creado: {user_data.username}")
+            
+            # Crear facturas de prueba (INSERT executemany por lotes, sin objetos ORM)
+            facturas_seed = [
+                (date(2024, 1, 15), Decimal("150.50"), models.EstadoFactura.PENDIENTE),
+                (date(2024, 2, 15), Decimal("220.75"), models.EstadoFactura.PAGADO),
+                (date(2024, 3, 15), Decimal("185.00"), models.EstadoFactura.PENDIENTE),
+            ]
+            rows = (
+                {
+                    "usuario_id": user_id,
+                    "fecha_emision": fecha_emision,
+                    "monto": monto,
+                    "estado": estado
+                }
+                for fecha_emision, monto, estado in facturas_seed
+            )
+            for chunk in chunked(rows, BATCH_SIZE):
+                db.execute(insert(models.Factura), chunk)
+            
+            print("Facturas de prueba creadas")
+        else:
+            print("Usuario admin ya existe")
+        
+        # Un único commit para el usuario y todos los lotes de facturas
+        db.commit()
+    finally:
+        db.close()
     
-    db.commit()
-    print("Facturas de prueba creadas")
-else:
-    print("Usuario admin ya existe")
+    print("Base de datos inicializada correctamente")
 
-db.close()
-print("Base de datos inicializada correctamente")
+if __name__ == "__main__":
+    main()
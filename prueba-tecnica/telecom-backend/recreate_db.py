@@ -1,9 +1,32 @@
 """
-Script para recrear las tablas de la base de datos
+Script para recrear las tablas de la base de datos.
+Por defecto solo vacía las tablas; el esquema se elimina y recrea únicamente
+si cambió respecto a los modelos o si se pasa --hard.
 """
+import argparse
+from sqlalchemy import inspect, text
 from app.database import engine
 from app import models
 
+def schema_changed():
+    """Indica si las tablas, columnas o índices de la BD difieren de los modelos."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            return True
+        
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        if columns != set(table.columns.keys()):
+            return True
+        
+        indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        if not {i.name for i in table.indexes} <= indexes:
+            return True
+    
+    return False
+
 def recreate_tables():
     """Elimina y recrea todas las tablas"""
     print("Eliminando tablas existentes...")
@@ -14,5 +37,28 @@ def recreate_tables():
     
     print("Tablas recreadas exitosamente!")
 
+def truncate_tables():
+    """Vacía todas las tablas en una sola transacción, sin tocar el esquema"""
+    tables = models.Base.metadata.sorted_tables
+    
+    print("Vaciando tablas existentes...")
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            names = ", ".join(table.name for table in tables)
+            conn.execute(text(f"TRUNCATE TABLE {names} RESTART IDENTITY CASCADE"))
+        else:
+            # SQLite no tiene TRUNCATE; un DELETE sin WHERE usa su optimización de truncado
+            for table in reversed(tables):
+                conn.execute(table.delete())
+    
+    print("Tablas vaciadas exitosamente!")
+
 if __name__ == "__main__":
-    recreate_tables()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hard", action="store_true", help="Eliminar y recrear el esquema completo")
+    args = parser.parse_args()
+    
+    if args.hard or schema_changed():
+        recreate_tables()
+    else:
+        truncate_tables()